@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Checks the FritzBox webhook publisher (src/services/fritzWebhook.py) against a
+local HTTP stand-in - no Supabase or network access needed.
+
+Covers:
+    - batching: events published within the batch window arrive in one request
+    - retry: 503 responses are retried until the endpoint accepts the batch
+    - 4xx: a rejected batch is dropped without retrying
+
+Usage:
+    python scripts/check-fritz-webhook.py
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from services.fritzWebhook import WebhookPublisher  # noqa: E402
+
+
+class StandIn(ThreadingHTTPServer):
+    """Answers with the queued status codes (201 once they run out) and records each request."""
+
+    def __init__(self, statuses):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.statuses = list(statuses)
+        self.requests = []
+        self.received = threading.Event()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/occupancy'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status = self.server.statuses.pop(0) if self.server.statuses else 201
+        self.server.requests.append({'status': status, 'body': body, 'token': self.headers.get('apikey')})
+        self.send_response(status)
+        self.end_headers()
+        if status < 500 and status != 429:
+            # Final answer - the publisher won't retry this batch
+            self.server.received.set()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(statuses, events, **options):
+    """Publishes `events` against a stand-in answering with `statuses`; returns the recorded requests."""
+    server = StandIn(statuses)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    publisher = WebhookPublisher(server.url, **options)
+    publisher.start()
+    for event in events:
+        publisher.publish(event)
+    server.received.wait(timeout=10)
+    publisher.stop(timeout=10)
+    server.shutdown()
+    return server.requests
+
+
+def check_batching():
+    requests = run([], [{'n': 1}, {'n': 2}, {'n': 3}], token='secret', batch_window=0.5)
+    assert len(requests) == 1, requests
+    assert requests[0]['body'] == [{'n': 1}, {'n': 2}, {'n': 3}], requests
+    assert requests[0]['token'] == 'secret', requests
+
+
+def check_retry():
+    # Backoff is 1 s, then 2 s
+    requests = run([503, 503], [{'n': 1}], batch_window=0.1, max_retries=3)
+    assert [request['status'] for request in requests] == [503, 503, 201], requests
+    assert all(request['body'] == [{'n': 1}] for request in requests), requests
+
+
+def check_client_error_dropped():
+    requests = run([400], [{'n': 1}], batch_window=0.1, max_retries=3)
+    assert [request['status'] for request in requests] == [400], requests
+
+
+if __name__ == '__main__':
+    for check in (check_batching, check_retry, check_client_error_dropped):
+        check()
+        print(f'ok  {check.__name__}')
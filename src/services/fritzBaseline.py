@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Learns the baseline (always-on devices) of a site from presence statistics.
+
+For every MAC that shows up as "new" the estimator keeps an exponentially
+weighted fraction of the time it was present, averaged over roughly the last
+FRITZ_BASELINE_WINDOW_HOURS. This approximates a sliding window in constant
+memory per device (a few numbers and the last host name). Each poll is weighted
+by the time since the previous one, so the adaptive poll interval (15 s after a
+transition, up to 10 min when stable) does not over-weight busy periods. A device
+that is present at least FRITZ_BASELINE_THRESHOLD of the time and was first seen
+at least FRITZ_BASELINE_MIN_AGE_HOURS ago is proposed for the baseline - the age
+limit keeps a long party evening from looking like an always-on device. With the
+defaults an always-on device reaches the threshold after about 2.3 windows (55 h).
+
+Proposals are exposed via /baseline/proposals. With FRITZ_BASELINE_AUTO_ADD=true
+they are added to the site's baseline right away, so a newly installed camera or
+repeater stops reporting the club as occupied.
+
+State is kept per site in FRITZ_BASELINE_DIR/<site id>.json. It has to survive
+deployments for the age limit to be reached: the default is outside the source
+tree ($XDG_STATE_HOME or ~/.local/state, then fritz-worker/baseline); the Docker
+image keeps it in the /var/lib/fritz-worker volume.
+"""
+
+import json
+import math
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Time the presence fraction averages over (time constant of the exponential decay)
+WINDOW_SECONDS = float(os.environ.get('FRITZ_BASELINE_WINDOW_HOURS', '24')) * 3600
+
+# Longer gaps between polls (service down) are counted as this many seconds
+MAX_GAP_SECONDS = 3600
+
+# Minimum presence fraction for a proposal
+THRESHOLD = float(os.environ.get('FRITZ_BASELINE_THRESHOLD', '0.9'))
+
+# Minimum time since a device was first seen before it can be proposed
+MIN_AGE_SECONDS = float(os.environ.get('FRITZ_BASELINE_MIN_AGE_HOURS', '72')) * 3600
+
+# Add proposals to the baseline automatically instead of only listing them
+AUTO_ADD = os.environ.get('FRITZ_BASELINE_AUTO_ADD', '').strip().lower() in ('1', 'true', 'yes')
+
+# Devices whose presence decayed below this are forgotten
+_PRUNE_BELOW = 0.001
+
+
+def default_baseline_dir():
+    """
+    Returns the directory for the per-site state files.
+    Prefers FRITZ_BASELINE_DIR, then $XDG_STATE_HOME/fritz-worker/baseline, then ~/.local/state/...
+    """
+    configured = os.environ.get('FRITZ_BASELINE_DIR', '').strip()
+    if configured:
+        return configured
+    state_home = os.environ.get('XDG_STATE_HOME', '').strip() or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(state_home, 'fritz-worker', 'baseline')
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class PresenceEstimator:
+    """
+    Streaming presence statistics for the non-baseline devices of one site.
+
+    Args:
+        site_id (str): Site the statistics belong to
+        window (float): Averaging window in seconds. Default: WINDOW_SECONDS
+        threshold (float): Presence fraction needed for a proposal. Default: THRESHOLD
+        min_age (float): Seconds since first seen needed for a proposal. Default: MIN_AGE_SECONDS
+        directory (str): Where the state file lives. Default: default_baseline_dir()
+    """
+
+    def __init__(self, site_id, window=WINDOW_SECONDS, threshold=THRESHOLD, min_age=MIN_AGE_SECONDS, directory=None):
+        self.site_id = site_id
+        self.window = max(1.0, window)
+        self.threshold = threshold
+        self.min_age = min_age
+        self.path = os.path.join(directory or default_baseline_dir(), f'{site_id}.json')
+        # mac -> {'presence', 'polls', 'first_seen', 'last_seen', 'name'}
+        self.devices = {}
+        # MACs added to the baseline by auto-add, kept across restarts
+        self.learned_macs = set()
+        # Epoch seconds of the last observe()
+        self.last_update = None
+
+    def observe(self, devices, now=None):
+        """
+        Updates the statistics with the non-baseline devices seen in one poll. The
+        observation counts for the time since the previous poll (at most MAX_GAP_SECONDS).
+
+        Args:
+            devices (list): Device dicts with 'mac' and 'name' (as returned by check_for_new_devices)
+            now (float): Epoch seconds. Default: time.time()
+        """
+        now = time.time() if now is None else now
+        present = {device['mac']: device.get('name') for device in devices}
+        elapsed = 0.0 if self.last_update is None else min(max(0.0, now - self.last_update), MAX_GAP_SECONDS)
+        alpha = 1.0 - math.exp(-elapsed / self.window)
+        self.last_update = now
+
+        for mac, stats in list(self.devices.items()):
+            if mac in present:
+                stats['presence'] += alpha * (1.0 - stats['presence'])
+                stats['last_seen'] = now
+                stats['name'] = present.pop(mac) or stats['name']
+            else:
+                stats['presence'] -= alpha * stats['presence']
+                if stats['presence'] < _PRUNE_BELOW:
+                    del self.devices[mac]
+                    continue
+            stats['polls'] += 1
+
+        # First sighting: the time before counts as absent
+        for mac, name in present.items():
+            self.devices[mac] = {
+                'presence': alpha, 'polls': 1, 'first_seen': now, 'last_seen': now, 'name': name,
+            }
+
+    def proposals(self, now=None):
+        """
+        Returns the devices that qualify for the baseline, most present first.
+
+        Returns:
+            list: Dicts with mac, name, presence, polls, first_seen and last_seen
+        """
+        now = time.time() if now is None else now
+        proposed = [
+            {
+                'mac': mac,
+                'name': stats['name'],
+                'presence': round(stats['presence'], 4),
+                'polls': stats['polls'],
+                'first_seen': _iso(stats['first_seen']),
+                'last_seen': _iso(stats['last_seen']),
+            }
+            for mac, stats in self.devices.items()
+            if stats['presence'] >= self.threshold and now - stats['first_seen'] >= self.min_age
+        ]
+        return sorted(proposed, key=lambda proposal: proposal['presence'], reverse=True)
+
+    def learn(self, macs):
+        """Marks MACs as part of the baseline and stops tracking them."""
+        for mac in macs:
+            self.learned_macs.add(mac)
+            self.devices.pop(mac, None)
+
+    def load(self):
+        """Restores the state saved by save(), if any."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        self.devices = state.get('devices', {})
+        self.learned_macs = set(state.get('learned_macs', []))
+        self.last_update = state.get('last_update')
+
+    def dumps(self):
+        """Serializes the state for save()."""
+        return json.dumps({
+            'site_id': self.site_id,
+            'devices': self.devices,
+            'learned_macs': sorted(self.learned_macs),
+            'last_update': self.last_update,
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+        })
+
+    def save(self, data=None):
+        """
+        Writes the state atomically (temp file + rename).
+
+        Args:
+            data (str): Output of dumps(), so the write can run on another thread
+                while the estimator keeps observing. Default: dumps()
+        """
+        data = self.dumps() if data is None else data
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Structured, non-blocking logging for the FritzBox worker and service.
+
+All loggers below 'fritz' write to a QueueHandler; a QueueListener thread formats
+the records and does the actual I/O. A slow stdout/stderr (container log driver,
+pipe) therefore never stalls a poll or a request.
+
+Every check runs under its own trace ID (see trace()). The ID is attached to all
+log lines written during the check, including those from the executor thread, and
+to the published snapshot, so a slow response can be matched to its log lines.
+
+Environment:
+    FRITZ_LOG_LEVEL    Minimum level. Default: INFO
+    FRITZ_LOG_FORMAT   'json' (one object per line) or 'text'. Default: json
+"""
+
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+trace_id_var = contextvars.ContextVar('fritz_trace_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed via extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def get_logger(name):
+    """Returns a logger below the 'fritz' hierarchy, e.g. get_logger('worker') -> 'fritz.worker'."""
+    return logging.getLogger(f'fritz.{name}')
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextlib.contextmanager
+def trace(trace_id=None):
+    """
+    Runs the block under a trace ID (a new one unless given).
+
+    Yields:
+        str: The trace ID
+    """
+    token = trace_id_var.set(trace_id or new_trace_id())
+    try:
+        yield trace_id_var.get()
+    finally:
+        trace_id_var.reset(token)
+
+
+class PhaseTimer:
+    """
+    Measures the phases of one check.
+
+    Usage:
+        timer = PhaseTimer()
+        connect()
+        timer.lap('vpn_connect')
+        enumerate_hosts()
+        timer.lap('enumerate')
+        log.info("check finished", extra=timer.fields())
+    """
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.phases_ms = {}
+
+    def lap(self, name):
+        """Records the time since the previous lap (or the start) as phase `name`."""
+        now = time.perf_counter()
+        self.phases_ms[name] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def fields(self):
+        """Log fields with the per-phase and total durations in milliseconds."""
+        return {
+            'phases_ms': dict(self.phases_ms),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Prepares records for the listener thread: renders message and traceback, and
+    stamps the trace ID - it lives in a contextvar of the calling thread.
+    Unlike the stock QueueHandler, extra fields stay separate from the message.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if getattr(record, 'trace_id', None) is None:
+            record.trace_id = trace_id_var.get()
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                # trace_id and fields passed via extra=
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format for local runs, with trace ID and extra fields appended."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.getMessage()}"
+        fields = {key: value for key, value in vars(record).items()
+                  if key not in _RECORD_ATTRIBUTES and key != 'trace_id' and value is not None}
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if getattr(record, 'trace_id', None):
+            line += f' [{record.trace_id}]'
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """
+    Routes the 'fritz' loggers through a queue to a background writer thread.
+    Safe to call more than once; only the first call takes effect.
+
+    Args:
+        level (str): Minimum level. Default: FRITZ_LOG_LEVEL or INFO
+        fmt (str): 'json' or 'text'. Default: FRITZ_LOG_FORMAT or json
+        stream: Output stream. Default: sys.stderr
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.environ.get('FRITZ_LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.environ.get('FRITZ_LOG_FORMAT', 'json')).lower()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+
+    root = logging.getLogger('fritz')
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
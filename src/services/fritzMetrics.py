@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Minimal in-process metrics, rendered in the Prometheus text format by /metrics.
+
+Metrics are per worker process. Values that only the poller knows (e.g. the
+scheduling decision of a site) are additionally carried in the shared snapshot,
+so every worker can report them.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_help = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def describe(name, help_text):
+    """Registers the HELP line for a metric."""
+    _help[name] = help_text
+
+
+def inc(name, labels=None, value=1):
+    """Increments a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, labels=None):
+    """Sets a gauge to the given value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for label, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{label}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render(extra_gauges=None):
+    """
+    Renders all metrics as Prometheus text.
+
+    Args:
+        extra_gauges (list): Additional (name, value, labels) gauges computed at scrape time
+
+    Returns:
+        str: Prometheus exposition text
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    for name, value, labels in extra_gauges or []:
+        gauges[_key(name, labels)] = value
+
+    lines = []
+    for kind, series in (('counter', counters), ('gauge', gauges)):
+        seen = set()
+        for (name, labels), value in sorted(series.items()):
+            if name not in seen:
+                seen.add(name)
+                if name in _help:
+                    lines.append(f'# HELP {name} {_help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
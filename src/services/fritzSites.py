@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Site registry and concurrent polling scheduler.
+
+A site is one club location with its own FritzBox, WireGuard tunnel and baseline.
+Without configuration the registry contains only DEFAULT_SITE from fritzWorker.py.
+Additional sites are read from a JSON list, either from the file named by
+FRITZ_SITES_FILE or inline from FRITZ_SITES:
+
+    [
+        {
+            "id": "wedel",
+            "router_address": "192.168.178.1",
+            "router_user": "admin",
+            "router_password": "...",
+            "wg_config": "[Interface]\\n...",
+            "baseline_macs": ["AC:41:6A:7B:3F:21"],
+            "baseline_ips": ["192.168.178.202"],
+            "poll_interval": 60,
+            "min_interval": 15,
+            "max_interval": 600,
+            "use_vpn": true,
+            "keep_vpn": true
+        }
+    ]
+
+Site IDs are 1-12 lowercase letters, digits or '-' ('default' is reserved for
+the built-in site). Sites with use_vpn (the default) need their own tunnel config,
+either as wg_config text or as a 'wireguard' dict like VPN_CONFIG['wireguard'].
+Sites that are polled through a tunnel must use distinct router subnets,
+since all tunnels share the host's routing table.
+
+With keep_vpn (the default) a site's tunnel and router session stay open between
+polls, so only the first poll after startup pays for bringing them up.
+
+Every site runs in its own asyncio task with its own interval, snapshot store and
+poller lock, so a slow or unreachable router never delays the other sites.
+
+The interval of a site adapts between min_interval and max_interval: it drops to
+the minimum right after an occupancy transition, doubles during stable periods
+without visitors asking, and is capped while requests come in (see AdaptivePollInterval).
+
+The poller also learns which unknown devices are always on (see fritzBaseline.py)
+and shares the baseline proposals with all workers.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from services import fritzMetrics as metrics
+from services.fritzBaseline import AUTO_ADD as BASELINE_AUTO_ADD, PresenceEstimator
+from services.fritzLogging import get_logger, trace
+from services.fritzWorker import DEFAULT_SITE, check_for_new_devices, get_connection_state, site_tunnel_name
+from services.fritzSnapshotStore import SnapshotStore
+from services.fritzWebhook import occupancy_event
+
+# Default seconds between two polls of a site (overridable per site)
+POLL_INTERVAL = float(os.environ.get('FRITZ_POLL_INTERVAL', '60'))
+
+# Bounds for the adaptive interval (overridable per site)
+MIN_POLL_INTERVAL = float(os.environ.get('FRITZ_POLL_MIN_INTERVAL', '15'))
+MAX_POLL_INTERVAL = float(os.environ.get('FRITZ_POLL_MAX_INTERVAL', '600'))
+
+# Upper bound for router checks running at the same time across all sites
+MAX_CONCURRENT_POLLS = int(os.environ.get('FRITZ_MAX_CONCURRENT_POLLS', '16'))
+
+# A site is not ready once its snapshot is this many seconds past the scheduled next poll
+READY_GRACE_SECONDS = float(os.environ.get('FRITZ_READY_GRACE', '120'))
+
+# A site is not ready after this many failed polls in a row
+READY_MAX_FAILURES = int(os.environ.get('FRITZ_READY_MAX_FAILURES', '3'))
+
+# Site IDs end up in file names and in the WireGuard interface name 'fb-<id>' (max. 15 characters)
+_SITE_ID_PATTERN = re.compile(r'^[a-z0-9-]{1,12}$')
+
+log = get_logger('sites')
+
+metrics.describe('fritz_poll_interval_seconds', 'Interval chosen for the next poll of a site')
+metrics.describe('fritz_poll_decisions_total', 'Scheduling decisions by reason')
+metrics.describe('fritz_request_rate_per_minute', 'Smoothed check-devices request rate seen by the poller')
+metrics.describe('fritz_baseline_learned_total', 'Devices added to a baseline by auto-add')
+
+
+def _normalize_site(raw):
+    """Fills in defaults for a site entry from the registry file."""
+    if not raw.get('id'):
+        raise ValueError(f"Site entry without id: {raw}")
+    site = dict(raw)
+    site['id'] = str(site['id'])
+    if not _SITE_ID_PATTERN.match(site['id']):
+        raise ValueError(f"Invalid site id {site['id']!r}: use 1-12 lowercase letters, digits or '-'")
+    if site['id'] == DEFAULT_SITE['id']:
+        raise ValueError(f"Site id {site['id']!r} is reserved for the built-in site")
+    if site.get('use_vpn', True) and not (site.get('wg_config') or site.get('wireguard')):
+        # Falling back to the club's own WireGuard keys would run a second peer on them
+        raise ValueError(f"Site {site['id']} uses a VPN but has neither wg_config nor wireguard")
+    site.setdefault('router_address', DEFAULT_SITE['router_address'])
+    site.setdefault('router_user', DEFAULT_SITE['router_user'])
+    site.setdefault('router_password', '')
+    site['baseline_macs'] = {mac.upper() for mac in site.get('baseline_macs', [])}
+    site['baseline_ips'] = set(site.get('baseline_ips', []))
+    return site
+
+
+def load_sites():
+    """
+    Loads the site registry.
+
+    Returns:
+        dict: site id -> site dict, in configuration order
+    """
+    sites_file = os.environ.get('FRITZ_SITES_FILE', '').strip()
+    sites_json = os.environ.get('FRITZ_SITES', '').strip()
+
+    if sites_file:
+        with open(sites_file, 'r', encoding='utf-8') as f:
+            raw_sites = json.load(f)
+    elif sites_json:
+        raw_sites = json.loads(sites_json)
+    else:
+        return {DEFAULT_SITE['id']: DEFAULT_SITE}
+
+    sites = {}
+    tunnels = {}
+    for raw in raw_sites:
+        site = _normalize_site(raw)
+        if site['id'] in sites:
+            raise ValueError(f"Duplicate site id: {site['id']}")
+        tunnel_name = site_tunnel_name(site)
+        if tunnel_name in tunnels:
+            raise ValueError(f"Sites {tunnels[tunnel_name]} and {site['id']} share tunnel name {tunnel_name}")
+        tunnels[tunnel_name] = site['id']
+        sites[site['id']] = site
+    return sites
+
+
+class AdaptivePollInterval:
+    """
+    Chooses the delay until the next poll of a site.
+
+    - transition: occupancy just changed -> min_interval, people tend to arrive/leave in groups
+    - demand: requests are coming in -> at most base / (1 + requests per minute)
+    - stable: nothing changed and nobody asks -> double the previous interval
+    - initial: first poll after startup -> base
+    The result is always clamped to [min_interval, max_interval].
+
+    Args:
+        base (float): Interval used when demand is low but present (poll_interval)
+        min_interval (float): Lower bound
+        max_interval (float): Upper bound
+    """
+
+    # Weight of the newest rate sample in the moving average
+    RATE_SMOOTHING = 0.5
+
+    def __init__(self, base, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.base = min(max(base, self.min_interval), self.max_interval)
+        self.interval = self.base
+        self.request_rate = 0.0  # requests per minute
+        self._last_count = None
+        self._last_time = None
+
+    def _update_rate(self, request_count, now):
+        if self._last_count is not None and now > self._last_time:
+            sample = (request_count - self._last_count) * 60.0 / (now - self._last_time)
+            self.request_rate += self.RATE_SMOOTHING * (sample - self.request_rate)
+        self._last_count = request_count
+        self._last_time = now
+
+    def demand_cap(self):
+        """Longest acceptable interval for the current request rate."""
+        return self.base / (1.0 + self.request_rate)
+
+    def next_interval(self, changed, request_count, now=None):
+        """
+        Args:
+            changed (bool): True if the last poll saw an occupancy transition
+            request_count (int): Shared request counter of the site
+            now (float): Monotonic timestamp. Default: time.monotonic()
+
+        Returns:
+            tuple: (float, str) - (seconds until the next poll, reason)
+        """
+        first_decision = self._last_count is None
+        self._update_rate(request_count, time.monotonic() if now is None else now)
+
+        if first_decision:
+            interval, reason = self.base, 'initial'
+        elif changed:
+            interval, reason = self.min_interval, 'transition'
+        else:
+            interval, reason = max(self.interval, self.base / 2) * 2, 'stable'
+            # Treat anything below one request per ten minutes as no demand
+            if self.request_rate >= 0.1 and interval > self.demand_cap():
+                interval, reason = self.demand_cap(), 'demand'
+
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return self.interval, reason
+
+
+class SiteScheduler:
+    """
+    Polls all sites concurrently and publishes one snapshot per site.
+
+    Args:
+        sites (dict): site id -> site dict (see load_sites())
+        webhook (WebhookPublisher): Receives occupancy transitions. Default: None
+    """
+
+    def __init__(self, sites, webhook=None):
+        self.sites = sites
+        self.webhook = webhook
+        self.stores = {
+            site_id: SnapshotStore(name=f'site-{site_id}') for site_id in sites
+        }
+        # Probe state after every poll attempt, successful or not (see site_health())
+        self.probes = {
+            site_id: SnapshotStore(name=f'site-{site_id}-probe', capacity=4096) for site_id in sites
+        }
+        # Baseline proposals of the poller, readable by every worker
+        self.baselines = {
+            site_id: SnapshotStore(name=f'site-{site_id}-baseline') for site_id in sites
+        }
+        # Presence statistics, loaded when this process first polls a site
+        self._estimators = {}
+        # Sites whose state this process has pushed to the webhook at least once
+        self._announced = set()
+        self._failures = {site_id: 0 for site_id in sites}
+        self._last_success = {}
+        self.intervals = {
+            site_id: AdaptivePollInterval(
+                float(site.get('poll_interval', POLL_INTERVAL)),
+                float(site.get('min_interval', MIN_POLL_INTERVAL)),
+                float(site.get('max_interval', MAX_POLL_INTERVAL)),
+            )
+            for site_id, site in sites.items()
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(MAX_CONCURRENT_POLLS, len(sites))),
+            thread_name_prefix='fritz-poll',
+        )
+        # Baseline state files are written here, not on the poll threads a hung router check may block
+        self._state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fritz-baseline')
+        self._tasks = []
+
+    @property
+    def default_site_id(self):
+        """The first configured site, served by the legacy /check-devices endpoint."""
+        return next(iter(self.sites))
+
+    def start(self):
+        """
+        Starts one poll loop per site. The poller's first poll runs right away and
+        doubles as pre-warming: it brings up the tunnel, opens the router session
+        and publishes the first snapshot before visitors ask for it.
+        """
+        if self.webhook:
+            self.webhook.start()
+        for site_id in self.sites:
+            self._tasks.append(asyncio.create_task(self._run_site(site_id)))
+
+    def tasks_alive(self):
+        """True while every site's poll loop is running (used by /livez)."""
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for store in self.stores.values():
+            store.release_poller()
+        for probe in self.probes.values():
+            probe.release_poller()
+        for baseline in self.baselines.values():
+            baseline.release_poller()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._state_executor.shutdown(wait=False)
+        if self.webhook:
+            # Flushing joins the sender thread, keep the event loop responsive meanwhile
+            await asyncio.to_thread(self.webhook.stop)
+
+    def _schedule(self, site_id, changed):
+        """Picks the next interval of a site and records the decision in metrics."""
+        interval, reason = self.intervals[site_id].next_interval(
+            changed, self.stores[site_id].request_count()
+        )
+        labels = {'site': site_id}
+        metrics.set_gauge('fritz_poll_interval_seconds', interval, labels)
+        metrics.set_gauge('fritz_request_rate_per_minute', round(self.intervals[site_id].request_rate, 3), labels)
+        metrics.inc('fritz_poll_decisions_total', {'site': site_id, 'reason': reason})
+        return interval, reason
+
+    def _estimator(self, site_id):
+        """
+        Returns the presence estimator of a site, restoring its saved state (and the
+        MACs learned earlier) on first use - possibly after taking over from another poller.
+        """
+        estimator = self._estimators.get(site_id)
+        if estimator is None:
+            estimator = PresenceEstimator(site_id)
+            try:
+                estimator.load()
+            except (OSError, ValueError) as e:
+                log.warning("Could not restore baseline statistics", extra={'site': site_id, 'error': str(e)})
+            self._add_to_baseline(site_id, estimator.learned_macs)
+            self._estimators[site_id] = estimator
+        return estimator
+
+    def _add_to_baseline(self, site_id, macs):
+        if macs:
+            site = self.sites[site_id]
+            # Rebind instead of mutating: the check may be reading the set in the executor
+            site['baseline_macs'] = set(site['baseline_macs']) | set(macs)
+
+    def _learn_baseline(self, site_id, new_devices):
+        """
+        Feeds one poll into the site's presence statistics, auto-adds proposals if
+        enabled and shares the current proposals.
+
+        Returns:
+            list: new_devices without the devices that were just added to the baseline
+        """
+        estimator = self._estimator(site_id)
+        estimator.observe(new_devices)
+        proposals = estimator.proposals()
+
+        if BASELINE_AUTO_ADD and proposals:
+            learned = [proposal['mac'] for proposal in proposals]
+            estimator.learn(learned)
+            self._add_to_baseline(site_id, learned)
+            metrics.inc('fritz_baseline_learned_total', {'site': site_id}, len(learned))
+            log.info("Added devices to baseline", extra={'site': site_id, 'macs': learned})
+            new_devices = [device for device in new_devices if device['mac'] not in learned]
+            proposals = []
+
+        self.baselines[site_id].publish({
+            "site_id": site_id,
+            "auto_add": BASELINE_AUTO_ADD,
+            "proposals": proposals,
+            "learned_macs": sorted(estimator.learned_macs),
+            "tracked_devices": len(estimator.devices),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        })
+        return new_devices
+
+    async def poll_site(self, site_id):
+        """
+        Runs one check for a site and publishes the result together with the
+        scheduling decision for the next poll.
+
+        Returns:
+            dict: The published snapshot
+        """
+        site = self.sites[site_id]
+        store = self.stores[site_id]
+        loop = asyncio.get_running_loop()
+        # Restores the learned baseline before the first check of this process
+        self._estimator(site_id)
+        with trace() as trace_id:
+            # check_for_new_devices blocks (subprocess + SOAP), keep it off the event loop.
+            # run_in_executor does not carry contextvars over, so pass the trace ID along.
+            has_new, new_devices = await loop.run_in_executor(
+                self._executor, contextvars.copy_context().run, check_for_new_devices,
+                site.get('vpn_method', 'wireguard'), site.get('use_vpn', True), site,
+                site.get('keep_vpn', True),
+            )
+        new_devices = self._learn_baseline(site_id, new_devices)
+        has_new = bool(new_devices)
+        previous = store.read()
+        changed = previous is not None and previous['has_new'] != has_new
+        interval, reason = self._schedule(site_id, changed)
+        snapshot = {
+            "site_id": site_id,
+            "has_new": has_new,
+            "new_devices": new_devices,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "next_poll_in": interval,
+            "poll_reason": reason,
+            "trace_id": trace_id,
+        }
+        store.publish(snapshot)
+        # Only the poller gets here, so each transition is pushed exactly once. The first
+        # state this process sees is pushed too: the database may be stale after a restart.
+        if self.webhook and (site_id not in self._announced or changed):
+            self.webhook.publish(occupancy_event(snapshot))
+            self._announced.add(site_id)
+        await self._save_estimator(site_id)
+        return snapshot
+
+    async def _save_estimator(self, site_id):
+        """
+        Persists the presence statistics on the state thread. Awaited, so saves of a
+        site never overtake each other; a failed save is logged and does not fail the poll.
+        """
+        estimator = self._estimators[site_id]
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._state_executor, estimator.save, estimator.dumps()
+            )
+        except Exception as e:
+            log.warning("Could not save baseline statistics", extra={'site': site_id, 'error': f"{type(e).__name__}: {e}"})
+
+    def baseline_proposals(self, site_id):
+        """
+        Returns the baseline proposals last shared by the site's poller.
+
+        Returns:
+            dict or None: None until the site was polled once
+        """
+        return self.baselines[site_id].read()
+
+    def _publish_probe(self, site_id, error=None):
+        """Shares the outcome of a poll attempt with all workers for /readyz."""
+        now = datetime.now(timezone.utc).isoformat()
+        if error is None:
+            self._failures[site_id] = 0
+            self._last_success[site_id] = now
+        else:
+            self._failures[site_id] += 1
+        probe = {
+            "site_id": site_id,
+            "last_attempt_at": now,
+            "last_success_at": self._last_success.get(site_id),
+            "last_error": error,
+            "consecutive_failures": self._failures[site_id],
+        }
+        probe.update(get_connection_state(self.sites[site_id]))
+        self.probes[site_id].publish(probe)
+
+    def site_health(self, site_id, now=None):
+        """
+        Evaluates a site's readiness from the shared snapshot and probe state only -
+        never touches the router, the tunnel or a subprocess.
+
+        Returns:
+            dict: Probe details plus 'ready' (bool) and 'snapshot_age' (seconds or None)
+        """
+        now = now or datetime.now(timezone.utc)
+        snapshot = self.stores[site_id].read()
+        probe = self.probes[site_id].read() or {}
+
+        health = {
+            "site_id": site_id,
+            "tunnel": probe.get("tunnel"),
+            "router_session": probe.get("router_session", False),
+            "last_success_at": probe.get("last_success_at"),
+            "last_error": probe.get("last_error"),
+            "consecutive_failures": probe.get("consecutive_failures", 0),
+            "snapshot_age": None,
+            "ready": False,
+        }
+        if snapshot is None:
+            return health
+
+        age = (now - datetime.fromisoformat(snapshot["checked_at"])).total_seconds()
+        max_age = snapshot.get("next_poll_in", POLL_INTERVAL) + READY_GRACE_SECONDS
+        health["snapshot_age"] = round(age, 3)
+        # A failed tunnel alone is not fatal: the router may still be reachable directly,
+        # in which case the poll succeeds and the snapshot stays fresh
+        health["ready"] = age <= max_age and health["consecutive_failures"] < READY_MAX_FAILURES
+        return health
+
+    async def _sleep_until_next_poll(self, site_id, interval):
+        """
+        Sleeps up to `interval` seconds, waking early once the base interval has
+        passed if requests came in meanwhile (e.g. first visitor after a quiet night).
+        """
+        adaptive = self.intervals[site_id]
+        store = self.stores[site_id]
+        count_before = store.request_count()
+        started = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed >= interval:
+                return
+            if store.request_count() > count_before and elapsed >= adaptive.base:
+                metrics.inc('fritz_poll_decisions_total', {'site': site_id, 'reason': 'demand_wakeup'})
+                return
+            await asyncio.sleep(min(adaptive.min_interval, interval - elapsed))
+
+    async def _run_site(self, site_id):
+        """
+        Poll loop of one site. Only the process holding the site's poller lock
+        polls; the others retry the lock every base interval so they can take over.
+        """
+        store = self.stores[site_id]
+        adaptive = self.intervals[site_id]
+        while True:
+            if not store.try_become_poller():
+                await asyncio.sleep(adaptive.base)
+                continue
+            try:
+                snapshot = await self.poll_site(site_id)
+                interval = snapshot['next_poll_in']
+                self._publish_probe(site_id)
+            except Exception as e:
+                # Keep serving the previous snapshot of this site (details were logged by the check)
+                log.warning("Polling site failed, keeping previous snapshot", extra={'site': site_id, 'error': str(e)})
+                interval, _ = self._schedule(site_id, False)
+                self._publish_probe(site_id, f"{type(e).__name__}: {e}")
+            await self._sleep_until_next_poll(site_id, interval)
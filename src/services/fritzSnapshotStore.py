@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Shared occupancy snapshot for multi-worker deployments.
+
+When uvicorn runs with several workers, only one process (the poller) talks to
+the FritzBox. The poller is elected by holding an exclusive lock on a lockfile;
+if it dies, the OS releases the lock and another worker takes over on its next
+attempt.
+
+The poller publishes the latest check result into a memory-mapped file that all
+workers map. Readers never take a lock: the file header carries a version stamp
+that is odd while a write is in progress (seqlock). A reader only decodes the
+payload when the version changed since its last read, so serving an unchanged
+snapshot costs one 8 byte read.
+
+Readers also bump a shared request counter, which the poller uses as a demand
+signal. The increment is not atomic across processes, so under contention a few
+requests may be lost - good enough for scheduling, not for accounting.
+
+The files outlive the processes (e.g. in /dev/shm across a service restart), but
+a snapshot must not: every process holds a shared lock on an instances file while
+it has the store open. The first process to open the store after all others are
+gone clears the header, so a restarted service reports "no snapshot yet" instead
+of the previous run's occupancy.
+
+File layout:
+    bytes 0-7    version (uint64, odd while the poller is writing)
+    bytes 8-11   payload length (uint32)
+    bytes 12-19  request counter (uint64)
+    bytes 20-    JSON payload
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows - no flock, every process polls for itself
+    fcntl = None
+
+_HEADER = struct.Struct('<QI')
+_COUNTER = struct.Struct('<Q')
+_COUNTER_OFFSET = _HEADER.size
+_PAYLOAD_OFFSET = _HEADER.size + _COUNTER.size
+DEFAULT_CAPACITY = 64 * 1024
+
+
+def default_snapshot_dir():
+    """
+    Returns the directory used for the snapshot and lock files.
+    Prefers FRITZ_SNAPSHOT_DIR, then /dev/shm (RAM-backed on Linux), then the temp dir.
+    """
+    configured = os.environ.get('FRITZ_SNAPSHOT_DIR', '').strip()
+    if configured:
+        return configured
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm/fritz-worker'
+    return os.path.join(tempfile.gettempdir(), 'fritz-worker')
+
+
+class SnapshotStore:
+    """
+    Memory-mapped snapshot shared between all worker processes.
+
+    Args:
+        name (str): Base name of the snapshot/lock files. Default: 'occupancy'
+        directory (str): Directory for the files. Default: default_snapshot_dir()
+        capacity (int): Maximum payload size in bytes. Default: 64 KiB
+    """
+
+    def __init__(self, name='occupancy', directory=None, capacity=DEFAULT_CAPACITY):
+        self.directory = directory or default_snapshot_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{name}.snapshot')
+        self.lock_path = os.path.join(self.directory, f'{name}.lock')
+        self.instances_path = os.path.join(self.directory, f'{name}.instances')
+        self.capacity = capacity
+
+        size = _PAYLOAD_OFFSET + capacity
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Only grow the file; shrinking would cut off a snapshot another worker is reading
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self._instances_fd = self._join_instances()
+        self._lock_fd = None
+        self._cached_version = 0
+        self._cached_snapshot = None
+
+    def _join_instances(self):
+        """
+        Registers this process as a user of the store, clearing snapshot and
+        request counter if it is the first one since all previous users exited.
+
+        Returns:
+            int: File descriptor holding the shared lock (None without fcntl)
+        """
+        if fcntl is None:
+            # No cross-process locking - every process has its own deployment
+            self._reset()
+            return None
+
+        fd = os.open(self.instances_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            pass  # Other processes of this deployment have the store open
+        else:
+            self._reset()
+        # Downgrade (or wait for the first process to finish its reset)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        return fd
+
+    def _reset(self):
+        """Forgets the snapshot and request counter of a previous run."""
+        _HEADER.pack_into(self._map, 0, 0, 0)
+        _COUNTER.pack_into(self._map, _COUNTER_OFFSET, 0)
+
+    # ------------------------------------------------------------------
+    # Poller election
+    # ------------------------------------------------------------------
+
+    @property
+    def is_poller(self):
+        """True if this process currently holds the poller lock."""
+        return self._lock_fd is not None
+
+    def try_become_poller(self):
+        """
+        Tries to acquire the poller lock without blocking.
+
+        Returns:
+            bool: True if this process is (or just became) the poller
+        """
+        if self._lock_fd is not None:
+            return True
+        if fcntl is None:
+            # No cross-process locking available - behave like a single worker
+            self._lock_fd = -1
+            return True
+
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        return True
+
+    def release_poller(self):
+        """Releases the poller lock so another worker can take over."""
+        if self._lock_fd is None:
+            return
+        if self._lock_fd >= 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+        self._lock_fd = None
+
+    # ------------------------------------------------------------------
+    # Publish / read
+    # ------------------------------------------------------------------
+
+    def version(self):
+        """Returns the current version stamp (0 if nothing was published yet)."""
+        return _HEADER.unpack_from(self._map, 0)[0]
+
+    def publish(self, snapshot):
+        """
+        Writes a new snapshot. Must only be called by the poller.
+
+        Args:
+            snapshot (dict): JSON-serializable snapshot
+
+        Returns:
+            int: The new version stamp
+        """
+        payload = json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.capacity:
+            raise ValueError(f"Snapshot too large ({len(payload)} > {self.capacity} bytes)")
+
+        version = self.version()
+        if version % 2:
+            # A previous writer died mid-write; skip past its odd stamp
+            version += 1
+
+        # Mark as "writing", copy payload, then publish the new even version
+        _HEADER.pack_into(self._map, 0, version + 1, len(payload))
+        self._map[_PAYLOAD_OFFSET:_PAYLOAD_OFFSET + len(payload)] = payload
+        _HEADER.pack_into(self._map, 0, version + 2, len(payload))
+        return version + 2
+
+    def read(self, retries=100):
+        """
+        Returns the latest snapshot without taking any lock.
+
+        The decoded snapshot is cached per process and only re-read when the version
+        stamp changes. Returns None if no snapshot has been published yet.
+        """
+        return self.read_versioned(retries)[1]
+
+    def read_versioned(self, retries=100):
+        """
+        Like read(), but also returns the version stamp of the snapshot, which callers
+        can use as a cache key for anything derived from it.
+
+        Returns:
+            tuple: (int, dict or None) - (version, snapshot); (0, None) if nothing was published
+        """
+        for _ in range(retries):
+            version, length = _HEADER.unpack_from(self._map, 0)
+            if version == 0:
+                return 0, None
+            if version == self._cached_version:
+                return version, self._cached_snapshot
+            if version % 2:
+                continue  # Writer in progress
+
+            payload = self._map[_PAYLOAD_OFFSET:_PAYLOAD_OFFSET + length]
+            if _HEADER.unpack_from(self._map, 0)[0] != version:
+                continue  # Overwritten while we copied it
+
+            self._cached_snapshot = json.loads(payload)
+            self._cached_version = version
+            return version, self._cached_snapshot
+
+        # Writer kept us out - serve what we had
+        return self._cached_version, self._cached_snapshot
+
+    # ------------------------------------------------------------------
+    # Demand
+    # ------------------------------------------------------------------
+
+    def record_request(self):
+        """Counts one client request for this snapshot (shared by all workers)."""
+        count = _COUNTER.unpack_from(self._map, _COUNTER_OFFSET)[0]
+        _COUNTER.pack_into(self._map, _COUNTER_OFFSET, count + 1)
+
+    def request_count(self):
+        """Returns the number of requests recorded since the store was (re)initialized."""
+        return _COUNTER.unpack_from(self._map, _COUNTER_OFFSET)[0]
+
+    def close(self):
+        self.release_poller()
+        if self._instances_fd is not None:
+            os.close(self._instances_fd)
+            self._instances_fd = None
+        self._map.close()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Pushes occupancy transitions to an external webhook.
+
+Instead of the check-devices edge function calling this service on every page view,
+the poller sends each transition (and the first state after startup) to
+FRITZ_WEBHOOK_URL, e.g. a Supabase REST table or an edge function. The website
+then reads the status from its database.
+
+Events are sent as a JSON array, so a PostgREST table endpoint stores one row per
+event. Sending runs on a background thread: events are batched for
+FRITZ_WEBHOOK_BATCH_WINDOW seconds and retried with exponential backoff, so a
+slow or unreachable endpoint never delays polling.
+
+Environment:
+    FRITZ_WEBHOOK_URL            Target URL (publishing is disabled if unset)
+    FRITZ_WEBHOOK_TOKEN          Sent as 'Authorization: Bearer' and 'apikey' (Supabase)
+    FRITZ_WEBHOOK_BATCH_WINDOW   Seconds to collect events before sending. Default: 2
+    FRITZ_WEBHOOK_MAX_RETRIES    Retries per batch before it is dropped. Default: 5
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from services import fritzMetrics as metrics
+from services.fritzLogging import get_logger
+
+log = get_logger('webhook')
+
+# Same wording the check-devices edge function stores in club_status
+MESSAGE_OCCUPIED = 'Aktuell ist jemand im Club, komm doch mal vorbei!'
+MESSAGE_EMPTY = 'Aktuell ist niemand im Club'
+
+_STOP = object()
+
+metrics.describe('fritz_webhook_events_total', 'Occupancy events handed to the webhook publisher')
+metrics.describe('fritz_webhook_batches_total', 'Webhook batches by outcome')
+
+
+def occupancy_event(snapshot):
+    """Builds the webhook event for a published snapshot."""
+    has_new = snapshot['has_new']
+    return {
+        'site_id': snapshot['site_id'],
+        'has_new_devices': has_new,
+        'is_occupied': has_new,
+        'device_count': len(snapshot['new_devices']),
+        'message': MESSAGE_OCCUPIED if has_new else MESSAGE_EMPTY,
+        'checked_at': snapshot['checked_at'],
+    }
+
+
+class WebhookPublisher:
+    """
+    Batches events and POSTs them to a webhook from a background thread.
+
+    Args:
+        url (str): Webhook URL
+        token (str): Optional bearer token (also sent as Supabase 'apikey' header)
+        batch_window (float): Seconds to wait for more events before sending. Default: 2
+        max_batch (int): Maximum events per request. Default: 50
+        max_retries (int): Retries per batch before it is dropped. Default: 5
+        timeout (float): HTTP timeout in seconds. Default: 10
+    """
+
+    def __init__(self, url, token='', batch_window=2.0, max_batch=50, max_retries=5, timeout=10):
+        self.url = url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Prefer': 'return=minimal',  # PostgREST: don't echo inserted rows
+        }
+        if token:
+            self.headers['Authorization'] = f'Bearer {token}'
+            self.headers['apikey'] = token
+
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='fritz-webhook', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Sends what is queued (without further retries) and stops the thread."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def publish(self, event):
+        """Queues an event. Never blocks."""
+        metrics.inc('fritz_webhook_events_total')
+        self._queue.put(event)
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is _STOP:
+                return
+
+            batch = [event]
+            stop_after = False
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop_after = True
+                    break
+                batch.append(event)
+
+            self._send(batch)
+            if stop_after:
+                return
+
+    def _send(self, batch):
+        """POSTs one batch, retrying with exponential backoff on network errors, 429 and 5xx."""
+        body = json.dumps(batch).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            request = urllib.request.Request(self.url, data=body, headers=self.headers, method='POST')
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    pass
+                metrics.inc('fritz_webhook_batches_total', {'outcome': 'sent'})
+                return True
+            except urllib.error.HTTPError as e:
+                if e.code < 500 and e.code != 429:
+                    # Client error - retrying the same payload won't help
+                    log.error("Webhook rejected batch", extra={'events': len(batch), 'status': e.code})
+                    break
+                error = f"HTTP {e.code}"
+            except (urllib.error.URLError, OSError) as e:
+                error = str(e)
+
+            if attempt == self.max_retries or self._stopping.is_set():
+                break
+            delay = min(2 ** attempt, 60)
+            log.warning("Webhook delivery failed, retrying", extra={'error': error, 'retry_in_s': delay})
+            metrics.inc('fritz_webhook_batches_total', {'outcome': 'retry'})
+            if self._stopping.wait(delay):
+                break
+
+        log.error("Dropping webhook batch", extra={'events': len(batch)})
+        metrics.inc('fritz_webhook_batches_total', {'outcome': 'dropped'})
+        return False
+
+
+def webhook_from_env():
+    """
+    Creates a WebhookPublisher from the FRITZ_WEBHOOK_* environment variables.
+
+    Returns:
+        WebhookPublisher or None: None if FRITZ_WEBHOOK_URL is not set
+    """
+    url = os.environ.get('FRITZ_WEBHOOK_URL', '').strip()
+    if not url:
+        return None
+    return WebhookPublisher(
+        url,
+        token=os.environ.get('FRITZ_WEBHOOK_TOKEN', '').strip(),
+        batch_window=float(os.environ.get('FRITZ_WEBHOOK_BATCH_WINDOW', '2')),
+        max_retries=int(os.environ.get('FRITZ_WEBHOOK_MAX_RETRIES', '5')),
+    )
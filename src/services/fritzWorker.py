@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
-from fritzconnection import FritzConnection
 from datetime import datetime, timedelta
 import subprocess
 import os
 import tempfile
+import threading
 import time
 import platform
 
+try:
+    from services.fritzLogging import PhaseTimer, get_logger, setup_logging, trace, trace_id_var
+except ImportError:  # Run as a script from src/services
+    from fritzLogging import PhaseTimer, get_logger, setup_logging, trace, trace_id_var
+
+log = get_logger('worker')
+
 # Baseline devices - always connected devices that should be filtered out
 BASELINE_MAC_ADDRESSES = {
     'AC:41:6A:7B:3F:21',  # Blink-Mini
@@ -45,13 +52,99 @@ VPN_CONFIG = {
     }
 }
 
+# The club's own FritzBox. Additional sites are configured via fritzSites.py;
+# each site dict carries the same keys (plus 'wg_config' / 'wireguard' for its tunnel).
+DEFAULT_SITE = {
+    'id': 'default',
+    'router_address': '192.168.178.1',
+    'router_user': 'admin',
+    'router_password': 'JC!Pferdestall',
+    'baseline_macs': BASELINE_MAC_ADDRESSES,
+    'baseline_ips': BASELINE_IP_ADDRESSES,
+}
+
+
+# FritzConnection per site id. Creating one downloads the router's service
+# descriptions (several seconds over VPN), so it is reused across checks.
+_router_sessions = {}
+_router_sessions_lock = threading.Lock()
+
+
+def get_router_session(site=None):
+    """
+    Returns the cached FritzConnection of a site, creating it on first use.
+    
+    Args:
+        site (dict): Site whose router to connect to. Default: DEFAULT_SITE
+    """
+    site = site or DEFAULT_SITE
+    with _router_sessions_lock:
+        fc = _router_sessions.get(site['id'])
+    if fc is None:
+        # Imported lazily: fritzconnection pulls in requests/urllib3, which only the
+        # poller process needs - the other service workers never talk to the router
+        from fritzconnection import FritzConnection
+        # Reduce timeout for faster failure detection
+        fc = FritzConnection(address=site['router_address'], user=site['router_user'],
+                             password=site['router_password'], timeout=10)
+        with _router_sessions_lock:
+            _router_sessions[site['id']] = fc
+    return fc
+
+
+def reset_router_session(site=None):
+    """Drops the cached FritzConnection of a site, e.g. after the tunnel went down."""
+    site = site or DEFAULT_SITE
+    with _router_sessions_lock:
+        _router_sessions.pop(site['id'], None)
+
+
+# Tunnel state per site id as seen by the last check:
+# 'up' (open after the check), 'idle' (torn down after the check by design),
+# 'failed' (could not connect) or 'not_used' (direct connection)
+_tunnel_states = {}
+
+# Tunnels brought up by a check with keep_vpn=True: site id -> (vpn_method, connection_name)
+_kept_tunnels = {}
 
-def connect_fritzbox_vpn(vpn_method='wireguard'):
+
+def get_connection_state(site=None):
+    """
+    Returns the tunnel and router session state recorded by the last check of a site.
+    Does not run any subprocess or router call, so it is cheap enough for health probes.
+    
+    Returns:
+        dict: {'tunnel': str or None, 'router_session': bool}
+    """
+    site = site or DEFAULT_SITE
+    with _router_sessions_lock:
+        has_session = site['id'] in _router_sessions
+    return {'tunnel': _tunnel_states.get(site['id']), 'router_session': has_session}
+
+
+def release_vpn(site=None):
+    """
+    Disconnects a tunnel that check_for_new_devices(keep_vpn=True) brought up for a site.
+    Tunnels that already existed before the first check are left alone.
+    """
+    site = site or DEFAULT_SITE
+    kept = _kept_tunnels.pop(site['id'], None)
+    if kept is None:
+        return
+    vpn_method, connection_name = kept
+    log.info("Disconnecting kept VPN connection (%s)", vpn_method)
+    disconnect_vpn(vpn_method, connection_name)
+    _tunnel_states[site['id']] = 'idle'
+    reset_router_session(site)
+
+
+def connect_fritzbox_vpn(vpn_method='wireguard', site=None):
     """
     Connects to FritzBox network using VPN services.
     
     Args:
         vpn_method (str): VPN method to use ('ipsec' or 'wireguard'). Default: 'wireguard'
+        site (dict): Site to connect to (WireGuard only). Default: DEFAULT_SITE
     
     Returns:
         tuple: (bool, subprocess.Popen or None, str) - (True if connection initiated, process object, connection_name)
@@ -63,9 +156,9 @@ def connect_fritzbox_vpn(vpn_method='wireguard'):
     if vpn_method.lower() == 'ipsec':
         return _connect_ipsec()
     elif vpn_method.lower() == 'wireguard':
-        return _connect_wireguard()
+        return _connect_wireguard(site or DEFAULT_SITE)
     else:
-        print(f"Unsupported VPN method: {vpn_method}")
+        log.error("Unsupported VPN method: %s", vpn_method)
         return False, None, None
 
 
@@ -121,11 +214,11 @@ if ($existing) {{
             stdout, stderr = process.communicate()
             
             if process.returncode == 0:
-                print(f"IPSec VPN connection initiated to {server}")
+                log.info("IPSec VPN connection initiated to %s", server)
                 return True, process, connection_name
             else:
-                print(f"IPSec VPN connection failed. Please configure manually.")
-                print(f"Error: {stderr.decode()}")
+                log.error("IPSec VPN connection failed. Please configure manually.")
+                log.error("IPSec error output: %s", stderr.decode())
                 return False, None, None
                 
         else:
@@ -134,7 +227,7 @@ if ($existing) {{
                 # Check if strongSwan is installed
                 subprocess.run(['which', 'ipsec'], check=True, capture_output=True)
             except (subprocess.CalledProcessError, FileNotFoundError):
-                print("Error: strongSwan (ipsec) not found. Please install strongSwan.")
+                log.error("strongSwan (ipsec) not found. Please install strongSwan.")
                 return False, None, None
             
             # Create strongSwan configuration
@@ -183,19 +276,19 @@ conn {connection_name}
             time.sleep(3)
             
             if process.poll() is None or process.returncode == 0:
-                print(f"IPSec VPN connection initiated to {server}")
+                log.info("IPSec VPN connection initiated to %s", server)
                 return True, process, connection_name
             else:
                 stdout, stderr = process.communicate()
-                print(f"IPSec VPN connection failed: {stderr.decode()}")
+                log.error("IPSec VPN connection failed: %s", stderr.decode())
                 return False, None, None
                 
     except Exception as e:
-        print(f"Error connecting via IPSec: {e}")
+        log.error("Error connecting via IPSec: %s", e)
         return False, None, None
 
 
-def _is_wireguard_connected():
+def _is_wireguard_connected(router_address='192.168.178.1'):
     """
     Check if WireGuard is already connected.
     Returns True if connection exists, False otherwise.
@@ -206,7 +299,7 @@ def _is_wireguard_connected():
         if system == 'windows':
             # On Windows, check if we can ping the FritzBox IP (VPN IP)
             try:
-                result = subprocess.run(['ping', '-n', '1', '-w', '2000', '192.168.178.1'], 
+                result = subprocess.run(['ping', '-n', '1', '-w', '2000', router_address], 
                                        capture_output=True, text=True, timeout=3)
                 if result.returncode == 0:
                     # Can ping FritzBox IP, likely connected via VPN
@@ -221,7 +314,7 @@ def _is_wireguard_connected():
                                        capture_output=True, text=True, timeout=3)
                 if result.returncode == 0 and result.stdout.strip():
                     # wg show returned something, check connectivity
-                    ping_result = subprocess.run(['ping', '-c', '1', '-W', '2', '192.168.178.1'], 
+                    ping_result = subprocess.run(['ping', '-c', '1', '-W', '2', router_address], 
                                                 capture_output=True, timeout=3)
                     if ping_result.returncode == 0:
                         # Can ping FritzBox IP, connected via VPN
@@ -234,38 +327,77 @@ def _is_wireguard_connected():
     return False
 
 
-def _connect_wireguard():
+def _render_wg_config(config):
+    """Renders a wg-quick config file from a VPN_CONFIG['wireguard']-style dict."""
+    return f"""[Interface]
+PrivateKey = {config['private_key']}
+Address = {config['address']}
+DNS = {', '.join(config['dns'])}
+
+[Peer]
+PublicKey = {config['public_key']}
+PresharedKey = {config['preshared_key']}
+AllowedIPs = {', '.join(config['allowed_ips'])}
+Endpoint = {config['server']}:{config['port']}
+PersistentKeepalive = {config['persistent_keepalive']}
+"""
+
+
+def site_tunnel_name(site):
+    """
+    Tunnel name for a site. wg-quick derives the Linux interface name from the
+    config file name, which is limited to 15 characters (site IDs are validated
+    to fit, see fritzSites._normalize_site).
+    """
+    if site is DEFAULT_SITE:
+        return "FritzBox_WireGuard"
+    return f"fb-{site['id']}"
+
+
+def _connect_wireguard(site=DEFAULT_SITE):
     """
     Connects via WireGuard VPN protocol.
     Uses existing config file (wg_config.conf) if available, otherwise creates one from VPN_CONFIG.
+    Sites other than DEFAULT_SITE bring their own config ('wg_config' text or 'wireguard' dict) -
+    they never fall back to the club's own keys, two peers sharing a key break each other's tunnels.
     Automatically activates the tunnel via CLI on Windows.
     Checks if connection already exists before connecting.
     """
-    config = VPN_CONFIG['wireguard']
-    server = config['server']
-    port = config['port']
+    is_default_site = site is DEFAULT_SITE
+    config = VPN_CONFIG['wireguard'] if is_default_site else site.get('wireguard')
+    if config:
+        server, port = config['server'], config['port']
+    else:
+        # Raw wg_config text - only used for log messages
+        server, port = site['router_address'], 'wg_config'
     
     # Check if already connected (saves time!)
-    if _is_wireguard_connected():
-        print("WireGuard VPN already connected, reusing existing connection.")
-        system = platform.system().lower()
-        tunnel_name = "FritzBox_WireGuard"
+    if _is_wireguard_connected(site['router_address']):
+        log.info("WireGuard VPN already connected, reusing existing connection.")
+        tunnel_name = site_tunnel_name(site)
         # Return True with None process since connection already exists
         return True, None, tunnel_name
     
     system = platform.system().lower()
-    tunnel_name = "FritzBox_WireGuard"
+    tunnel_name = site_tunnel_name(site)
     
     # Check for WireGuard config from environment variable first (for VPS deployments)
-    wg_config_from_env = os.environ.get('WG_CONFIG', '').strip()
+    wg_config_from_env = os.environ.get('WG_CONFIG', '').strip() if is_default_site else ''
     
     script_dir = os.path.dirname(os.path.abspath(__file__))
     existing_config = os.path.join(script_dir, 'wg_config.conf')
     
     try:
+        # Registry sites: write the site's config under the tunnel name, so each
+        # site gets its own interface and can be brought down on its own
+        if not is_default_site:
+            wg_config_path = os.path.join(tempfile.gettempdir(), f'{tunnel_name}.conf')
+            with open(wg_config_path, 'w') as f:
+                f.write(site.get('wg_config') or _render_wg_config(config))
+            os.chmod(wg_config_path, 0o600)
         # Priority 1: Use environment variable if set (for VPS deployments)
-        if wg_config_from_env:
-            print("Using WireGuard config from WG_CONFIG environment variable")
+        elif wg_config_from_env:
+            log.info("Using WireGuard config from WG_CONFIG environment variable")
             # Create temporary file from environment variable
             wg_config = tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False)
             wg_config.write(wg_config_from_env)
@@ -273,25 +405,14 @@ def _connect_wireguard():
             wg_config_path = wg_config.name
         # Priority 2: Use existing config file if it exists
         elif os.path.exists(existing_config):
-            print(f"Using existing WireGuard config file: {existing_config}")
+            log.info("Using existing WireGuard config file wg_config.conf")
             wg_config_path = existing_config
         # Priority 3: Create from VPN_CONFIG
         else:
             # Create WireGuard configuration file from VPN_CONFIG
-            print("Creating WireGuard config file from VPN_CONFIG...")
+            log.info("Creating WireGuard config file from VPN_CONFIG")
             wg_config = tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False)
-            wg_config.write(f"""[Interface]
-PrivateKey = {config['private_key']}
-Address = {config['address']}
-DNS = {', '.join(config['dns'])}
-
-[Peer]
-PublicKey = {config['public_key']}
-PresharedKey = {config['preshared_key']}
-AllowedIPs = {', '.join(config['allowed_ips'])}
-Endpoint = {server}:{port}
-PersistentKeepalive = {config['persistent_keepalive']}
-""")
+            wg_config.write(_render_wg_config(config))
             wg_config.close()
             wg_config_path = wg_config.name
         
@@ -323,12 +444,11 @@ PersistentKeepalive = {config['persistent_keepalive']}
                     pass
             
             if not wg_exe:
-                print("Error: WireGuard client not found.")
-                print("Please install WireGuard from https://www.wireguard.com/install/")
-                print(f"Config file available at: {wg_config_path}")
+                log.error("WireGuard client not found. Please install WireGuard from https://www.wireguard.com/install/")
+                log.debug("Config file available at: %s", wg_config_path)
                 return False, None, None
             
-            print(f"Found WireGuard at: {wg_exe}")
+            log.debug("Found WireGuard at: %s", wg_exe)
             
             # On Windows, WireGuard configs need to be in the Configurations directory
             # or we can use the config file directly with full path
@@ -339,7 +459,7 @@ PersistentKeepalive = {config['persistent_keepalive']}
             
             # Copy config file to WireGuard's config directory
             shutil.copy(wg_config_path, wg_config_dest)
-            print(f"Config file copied to: {wg_config_dest}")
+            log.debug("Config file copied to: %s", wg_config_dest)
             
             try:
                 # First, check if tunnel service is already installed
@@ -355,7 +475,7 @@ PersistentKeepalive = {config['persistent_keepalive']}
                 
                 # Install and activate the tunnel service using CLI
                 # This requires admin privileges but works automatically
-                print(f"Installing and activating WireGuard tunnel '{tunnel_name}'...")
+                log.info("Installing and activating WireGuard tunnel %r", tunnel_name)
                 process = subprocess.Popen(
                     [wg_exe, '/installtunnelservice', wg_config_dest],
                     stdout=subprocess.PIPE,
@@ -367,8 +487,7 @@ PersistentKeepalive = {config['persistent_keepalive']}
                 stdout, stderr = process.communicate(timeout=10)
                 
                 if process.returncode == 0:
-                    print(f"WireGuard VPN connection activated successfully to {server}:{port}")
-                    print(f"Tunnel name: {tunnel_name}")
+                    log.info("WireGuard VPN connection activated to %s:%s (tunnel %s)", server, port, tunnel_name)
                     # Give it a moment to establish connection
                     time.sleep(2)
                     return True, process, tunnel_name
@@ -376,25 +495,22 @@ PersistentKeepalive = {config['persistent_keepalive']}
                     error_msg = stderr.decode() if stderr else stdout.decode()
                     # Check if it's a permission error
                     if 'access' in error_msg.lower() or 'privilege' in error_msg.lower() or 'administrator' in error_msg.lower():
-                        print(f"Error: Administrator privileges required to activate WireGuard.")
-                        print(f"Please run this script as Administrator, or manually activate the tunnel:")
-                        print(f'  "{wg_exe}" /installtunnelservice "{wg_config_dest}"')
-                        print(f"Config file saved at: {wg_config_dest}")
+                        log.error("Administrator privileges required to activate WireGuard. "
+                                  "Run as Administrator or activate the tunnel manually with wireguard.exe /installtunnelservice")
+                        log.debug("Manual activation: \"%s\" /installtunnelservice \"%s\"", wg_exe, wg_config_dest)
                         return False, None, None
                     else:
-                        print(f"WireGuard installation failed: {error_msg}")
-                        print(f"Config file saved at: {wg_config_dest}")
+                        log.error("WireGuard installation failed: %s", error_msg)
+                        log.debug("Config file saved at: %s", wg_config_dest)
                         return False, None, None
                     
             except subprocess.TimeoutExpired:
-                print("Error: WireGuard installation timed out.")
-                print(f"Config file saved at: {wg_config_dest}")
+                log.error("WireGuard installation timed out.")
+                log.debug("Config file saved at: %s", wg_config_dest)
                 return False, None, None
             except Exception as e:
-                print(f"Error setting up WireGuard: {e}")
-                print(f"Config file saved at: {wg_config_dest}")
-                print(f"Try running manually as Administrator:")
-                print(f'  "{wg_exe}" /installtunnelservice "{wg_config_dest}"')
+                log.error("Error setting up WireGuard: %s. Try running as Administrator.", e)
+                log.debug("Manual activation: \"%s\" /installtunnelservice \"%s\"", wg_exe, wg_config_dest)
                 return False, None, None
                 
         else:
@@ -403,8 +519,8 @@ PersistentKeepalive = {config['persistent_keepalive']}
             try:
                 subprocess.run(['which', 'wg-quick'], check=True, capture_output=True)
             except (subprocess.CalledProcessError, FileNotFoundError):
-                print("Error: WireGuard (wg-quick) not found. Please install WireGuard.")
-                print(f"Config file available at: {wg_config_path}")
+                log.error("WireGuard (wg-quick) not found. Please install WireGuard.")
+                log.debug("Config file available at: %s", wg_config_path)
                 return False, None, None
             
             # Check if we're running as root (common in Docker containers)
@@ -431,22 +547,22 @@ PersistentKeepalive = {config['persistent_keepalive']}
                 # Check if process is still running or completed successfully
                 if process.poll() is None:
                     # Process is still running (good - connection established)
-                    print(f"WireGuard VPN connection initiated to {server}:{port}")
+                    log.info("WireGuard VPN connection initiated to %s:%s", server, port)
                     return True, process, tunnel_name
                 elif process.returncode == 0:
                     # Process completed successfully
-                    print(f"WireGuard VPN connection established to {server}:{port}")
+                    log.info("WireGuard VPN connection established to %s:%s", server, port)
                     return True, process, tunnel_name
                 else:
                     # Process failed
                     stdout, stderr = process.communicate()
                     error_msg = stderr.decode() if stderr else stdout.decode()
-                    print(f"WireGuard VPN connection failed: {error_msg}")
-                    print(f"Config file location: {wg_config_path}")
+                    log.error("WireGuard VPN connection failed: %s", error_msg)
+                    log.debug("Config file location: %s", wg_config_path)
                     
                     # If sudo failed, try without sudo (for containers running as root)
                     if 'sudo' in str(wg_quick_cmd) and 'permission' in error_msg.lower():
-                        print("Retrying without sudo (assuming root privileges)...")
+                        log.info("Retrying without sudo (assuming root privileges)")
                         process2 = subprocess.Popen(
                             ['wg-quick', 'up', wg_config_path],
                             stdout=subprocess.PIPE,
@@ -454,13 +570,12 @@ PersistentKeepalive = {config['persistent_keepalive']}
                         )
                         time.sleep(1.5)
                         if process2.poll() is None or process2.returncode == 0:
-                            print(f"WireGuard VPN connection established (without sudo) to {server}:{port}")
+                            log.info("WireGuard VPN connection established (without sudo) to %s:%s", server, port)
                             return True, process2, tunnel_name
                     
                     return False, None, None
             except FileNotFoundError as e:
-                print(f"Error: Command not found: {e}")
-                print("Trying without sudo...")
+                log.warning("Command not found: %s. Trying without sudo...", e)
                 # Try without sudo as fallback
                 try:
                     process = subprocess.Popen(
@@ -470,18 +585,18 @@ PersistentKeepalive = {config['persistent_keepalive']}
                     )
                     time.sleep(3)
                     if process.poll() is None or process.returncode == 0:
-                        print(f"WireGuard VPN connection established to {server}:{port}")
+                        log.info("WireGuard VPN connection established to %s:%s", server, port)
                         return True, process, tunnel_name
                     else:
                         stdout, stderr = process.communicate()
-                        print(f"WireGuard VPN connection failed: {stderr.decode()}")
+                        log.error("WireGuard VPN connection failed: %s", stderr.decode())
                         return False, None, None
                 except Exception as e2:
-                    print(f"Error connecting via WireGuard: {e2}")
+                    log.error("Error connecting via WireGuard: %s", e2)
                     return False, None, None
                 
     except Exception as e:
-        print(f"Error connecting via WireGuard: {e}")
+        log.error("Error connecting via WireGuard: %s", e)
         return False, None, None
 
 
@@ -522,20 +637,30 @@ def disconnect_vpn(vpn_method='wireguard', connection_name=None):
                             timeout=10
                         )
                         if result.returncode == 0:
-                            print(f"WireGuard tunnel '{tunnel_name}' disconnected successfully.")
+                            log.info("WireGuard tunnel %r disconnected successfully.", tunnel_name)
                         else:
                             # Tunnel might not be active, which is fine
                             error_msg = result.stderr.decode() if result.stderr else ""
                             if 'not found' not in error_msg.lower() and error_msg:
-                                print(f"Note: {error_msg}")
+                                log.info("WireGuard disconnect note: %s", error_msg)
                     except subprocess.TimeoutExpired:
-                        print(f"Warning: WireGuard disconnect timed out.")
+                        log.warning("WireGuard disconnect timed out.")
                     except Exception as e:
-                        print(f"Note: Could not disconnect WireGuard automatically: {e}")
-                        print(f"Run manually: \"{wg_exe}\" /uninstalltunnelservice \"{tunnel_name}\"")
+                        log.warning("Could not disconnect WireGuard automatically: %s", e)
+                        log.warning("Run manually: \"%s\" /uninstalltunnelservice \"%s\"", wg_exe, tunnel_name)
                 else:
-                    print(f"WireGuard not found. Tunnel '{tunnel_name}' may still be active.")
+                    log.warning("WireGuard not found. Tunnel %r may still be active.", tunnel_name)
             else:
+                # Registry sites have their own config file named after the tunnel:
+                # only bring down that interface so other sites keep their tunnels
+                site_config = os.path.join(tempfile.gettempdir(), f'{connection_name}.conf') if connection_name else None
+                if site_config and os.path.exists(site_config):
+                    try:
+                        subprocess.run(['wg-quick', 'down', site_config],
+                                     capture_output=True, timeout=5)
+                    except (FileNotFoundError, subprocess.TimeoutExpired):
+                        pass
+                    return
                 # Find active WireGuard interface
                 # Try without sudo first (for Docker containers)
                 try:
@@ -574,10 +699,10 @@ def disconnect_vpn(vpn_method='wireguard', connection_name=None):
                     subprocess.run(['sudo', 'ipsec', 'down', connection_name],
                                  capture_output=True)
     except Exception as e:
-        print(f"Error disconnecting VPN: {e}")
+        log.error("Error disconnecting VPN: %s", e)
 
 
-def check_for_new_devices(vpn_method='wireguard', use_vpn=True):
+def check_for_new_devices(vpn_method='wireguard', use_vpn=True, site=None, keep_vpn=False):
     """
     Checks if there are any new devices (not in baseline) connected to the WLAN in the last 10 minutes.
     Connects via VPN if use_vpn is True.
@@ -585,36 +710,59 @@ def check_for_new_devices(vpn_method='wireguard', use_vpn=True):
     Args:
         vpn_method (str): VPN method to use ('ipsec' or 'wireguard'). Default: 'wireguard'
         use_vpn (bool): Whether to connect via VPN first. Default: True
+        site (dict): Site whose router, tunnel and baseline to use. Default: DEFAULT_SITE
+        keep_vpn (bool): Leave a newly created tunnel up for the next check. Default: False
     
     Returns:
         tuple: (bool, list) - (True if new devices found, list of new devices with details)
     """
+    site = site or DEFAULT_SITE
+    # Reuse the caller's trace ID (the service's scheduler sets one per poll)
+    with trace(trace_id_var.get()):
+        timer = PhaseTimer()
+        try:
+            has_new, new_devices = _check_site_devices(vpn_method, use_vpn, site, keep_vpn, timer)
+        except Exception:
+            log.exception("Device check failed", extra={'site': site['id'], **timer.fields()})
+            raise
+        log.info("Device check finished", extra={
+            'site': site['id'], 'has_new': has_new, 'new_device_count': len(new_devices), **timer.fields()
+        })
+        return has_new, new_devices
+
+
+def _check_site_devices(vpn_method, use_vpn, site, keep_vpn, timer):
+    """Body of check_for_new_devices(); records its phases on `timer`."""
     vpn_connected = False
     connection_name = None
     vpn_process = None
     
     # Connect via VPN if needed
     if use_vpn:
-        print(f"Connecting to FritzBox VPN via {vpn_method}...")
-        vpn_connected, vpn_process, connection_name = connect_fritzbox_vpn(vpn_method)
+        log.info("Connecting to FritzBox VPN via %s", vpn_method)
+        vpn_connected, vpn_process, connection_name = connect_fritzbox_vpn(vpn_method, site)
         
+        _tunnel_states[site['id']] = 'up' if vpn_connected else 'failed'
         if not vpn_connected:
-            print("Warning: VPN connection failed. Attempting direct connection...")
+            log.warning("VPN connection failed. Attempting direct connection...")
         else:
             # Only wait if we just connected (not if reusing existing connection)
             if vpn_process is not None:
                 # Wait a bit for VPN to establish (reduced from 5s to 2s for performance)
-                print("Waiting for VPN connection to establish...")
+                log.debug("Waiting for VPN connection to establish")
                 time.sleep(2)
             else:
                 # Reusing existing connection, minimal wait
-                print("Using existing VPN connection, minimal wait...")
+                log.debug("Using existing VPN connection, minimal wait")
                 time.sleep(0.5)
+    else:
+        _tunnel_states[site['id']] = 'not_used'
+    timer.lap('vpn_connect')
     
     try:
         # Connect to FritzBox (should work via VPN if connected, or directly if on same network)
-        # Reduce timeout for faster failure detection
-        fc = FritzConnection(address='192.168.178.1', user='admin', password='JC!Pferdestall', timeout=10)
+        fc = get_router_session(site)
+        timer.lap('router_session')
         
         # Get number of hosts
         num_hosts = fc.call_action('Hosts', 'GetHostNumberOfEntries')
@@ -659,51 +807,158 @@ def check_for_new_devices(vpn_method='wireguard', use_vpn=True):
                     'ip': ip_address,
                     'mac': mac_address
                 })
+        timer.lap('enumerate')
+        log.debug("Router hosts enumerated", extra={'hosts': total_hosts, 'active': len(all_active_devices)})
         
         # Filter out baseline devices (by MAC address or IP address)
         new_devices = [
             device for device in all_active_devices
             if device['mac'] != 'N/A' 
-            and device['mac'] not in BASELINE_MAC_ADDRESSES
-            and device['ip'] not in BASELINE_IP_ADDRESSES
+            and device['mac'] not in site['baseline_macs']
+            and device['ip'] not in site['baseline_ips']
         ]
         
         # Return boolean and list of new devices
         has_new = len(new_devices) > 0
         return has_new, new_devices
         
+    except Exception:
+        # Session may be stale (tunnel rebuilt, router rebooted) - start fresh next time
+        reset_router_session(site)
+        raise
     finally:
         # Disconnect VPN if we connected (but not if we reused an existing connection)
         # Only disconnect if vpn_process is not None (meaning we created a new connection)
-        if use_vpn and vpn_connected and connection_name and vpn_process is not None:
-            print(f"Disconnecting from VPN ({vpn_method})...")
+        if use_vpn and vpn_connected and vpn_process is not None and keep_vpn:
+            log.info("Keeping new VPN connection active for the next check.")
+            _kept_tunnels[site['id']] = (vpn_method, connection_name)
+        elif use_vpn and vpn_connected and connection_name and vpn_process is not None:
+            log.info("Disconnecting from VPN (%s)", vpn_method)
             disconnect_vpn(vpn_method, connection_name)
+            _tunnel_states[site['id']] = 'idle'
+            timer.lap('vpn_disconnect')
         elif use_vpn and vpn_connected and vpn_process is None:
-            print("Keeping existing VPN connection active (reused connection).")
+            log.debug("Keeping existing VPN connection active (reused connection).")
+
+
+def watch_devices(emit, interval=60, vpn_method='wireguard', use_vpn=True, changes_only=False,
+                  stop_event=None, site=None):
+    """
+    Polls continuously and emits one JSON line per poll.
+    Keeps the tunnel and router session open between polls and releases the
+    tunnel on return.
+    
+    Args:
+        emit (callable): Receives each JSON line (str)
+        interval (float): Seconds between polls. Default: 60
+        vpn_method (str): VPN method to use ('ipsec' or 'wireguard'). Default: 'wireguard'
+        use_vpn (bool): Whether to connect via VPN. Default: True
+        changes_only (bool): Only emit when occupancy or the set of new devices changes
+                             (errors are always emitted). Default: False
+        stop_event (threading.Event): Set to stop after the current poll. Default: never
+        site (dict): Site to watch. Default: DEFAULT_SITE
+    """
+    import json
+    
+    site = site or DEFAULT_SITE
+    stop_event = stop_event or threading.Event()
+    last_state = None
+    try:
+        while not stop_event.is_set():
+            started = time.monotonic()
+            with trace() as trace_id:
+                record = {
+                    'ts': datetime.now().astimezone().isoformat(),
+                    'site_id': site['id'],
+                    'trace_id': trace_id,
+                }
+                try:
+                    has_new, new_devices = check_for_new_devices(vpn_method, use_vpn, site, keep_vpn=True)
+                    state = (has_new, tuple(sorted(device['mac'] for device in new_devices)))
+                    changed = state != last_state
+                    last_state = state
+                    record.update({
+                        'is_occupied': has_new,
+                        'device_count': len(new_devices),
+                        'new_devices': new_devices,
+                        'changed': changed,
+                    })
+                except Exception as e:
+                    changed = True
+                    # The stream now shows the error; the next successful poll must be written again
+                    last_state = None
+                    record['error'] = f"{type(e).__name__}: {e}"
+                record['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+            
+            if changed or not changes_only:
+                emit(json.dumps(record, ensure_ascii=False))
+            stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        if use_vpn:
+            release_vpn(site)
 
 
 if __name__ == '__main__':
+    import argparse
+    import signal
     import sys
     
-    # Parse command line arguments
-    vpn_method = 'wireguard'  # Default to WireGuard
-    use_vpn = True  # Default to using VPN
-    
-    if len(sys.argv) > 1:
-        if sys.argv[1] in ['ipsec', 'wireguard']:
-            vpn_method = sys.argv[1]
-        elif sys.argv[1] == '--no-vpn':
-            use_vpn = False
-        elif sys.argv[1] == '--direct':
-            use_vpn = False
+    # Parse command line arguments (positional VPN method and --no-vpn/--direct as before)
+    parser = argparse.ArgumentParser(description="Check the FritzBox for devices that are not in the baseline.")
+    parser.add_argument('vpn_method', nargs='?', choices=['ipsec', 'wireguard'], default='wireguard',
+                        help="VPN method to use (default: wireguard)")
+    parser.add_argument('--no-vpn', '--direct', dest='use_vpn', action='store_false',
+                        help="Connect to the FritzBox directly instead of via VPN")
+    parser.add_argument('--watch', action='store_true',
+                        help="Poll continuously and write one JSON line per poll")
+    parser.add_argument('--interval', type=float, default=60,
+                        help="Seconds between polls in --watch mode (default: 60)")
+    parser.add_argument('--changes-only', action='store_true',
+                        help="In --watch mode, only write a line when occupancy or the new devices change")
+    parser.add_argument('--output', metavar='FILE',
+                        help="In --watch mode, write JSON lines to a rotating file instead of stdout")
+    parser.add_argument('--max-bytes', type=int, default=10 * 1024 * 1024,
+                        help="Rotate --output after this many bytes (default: 10 MiB)")
+    parser.add_argument('--backup-count', type=int, default=5,
+                        help="Rotated --output files to keep (default: 5)")
+    args = parser.parse_args()
+    vpn_method = args.vpn_method
+    use_vpn = args.use_vpn
     
-    if len(sys.argv) > 2:
-        if sys.argv[2] in ['ipsec', 'wireguard']:
-            vpn_method = sys.argv[2]
-        elif sys.argv[2] == '--no-vpn':
-            use_vpn = False
+    # Human-readable logs on the console unless FRITZ_LOG_FORMAT says otherwise.
+    # Logs go to stderr, so stdout only carries results.
+    setup_logging(fmt=os.environ.get('FRITZ_LOG_FORMAT', 'text'))
+    log.info("Using VPN method: %s", vpn_method if use_vpn else 'None (direct connection)')
     
-    print(f"Using VPN method: {vpn_method if use_vpn else 'None (direct connection)'}")
+    if args.watch:
+        if args.output:
+            import logging.handlers
+            output_handler = logging.handlers.RotatingFileHandler(
+                args.output, maxBytes=args.max_bytes, backupCount=args.backup_count, encoding='utf-8'
+            )
+            
+            def emit(line):
+                output_handler.emit(logging.makeLogRecord({'msg': line}))
+        else:
+            output_handler = None
+            
+            def emit(line):
+                print(line, flush=True)
+        
+        # Finish the current poll, release the tunnel and exit on Ctrl+C / SIGTERM
+        stop_event = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop_event.set())
+        
+        log.info("Watching every %ss", args.interval)
+        try:
+            watch_devices(emit, interval=args.interval, vpn_method=vpn_method, use_vpn=use_vpn,
+                          changes_only=args.changes_only, stop_event=stop_event)
+        finally:
+            if output_handler:
+                output_handler.close()
+        log.info("Watch stopped")
+        sys.exit(0)
     
     try:
         has_new, new_devices = check_for_new_devices(vpn_method=vpn_method, use_vpn=use_vpn)
@@ -721,21 +976,17 @@ if __name__ == '__main__':
         exit_code = 0 if not has_new else 1
         
     except Exception as e:
-        print(f"\n{'='*50}")
+        # Traceback was already logged by check_for_new_devices
         print(f"ERROR: {type(e).__name__}: {e}")
-        print(f"{'='*50}")
-        import traceback
-        traceback.print_exc()
         exit_code = 1
     
-    # Keep window open to see output
-    print("\n" + "="*50)
-    print("Press Enter to exit...")
-    try:
-        input()
-    except (EOFError, KeyboardInterrupt):
-        pass
+    # Keep window open to see output (only when started interactively)
+    if sys.stdin.isatty():
+        print("\n" + "="*50)
+        print("Press Enter to exit...")
+        try:
+            input()
+        except (EOFError, KeyboardInterrupt):
+            pass
     
-    exit(exit_code)
-
-
+    sys.exit(exit_code)
@@ -9,21 +9,105 @@ Usage:
 
     # Or with uvicorn (recommended for production)
     uvicorn src.services.fritzWorkerService:app --host 0.0.0.0 --port 8000
+
+    # Several workers share one router poller (see fritzSnapshotStore.py)
+    uvicorn src.services.fritzWorkerService:app --host 0.0.0.0 --port 8000 --workers 4
 """
 
-from fastapi import FastAPI, HTTPException, Header
+import time
+
+# Reference point for the time-to-ready metric
+_STARTED_AT = time.monotonic()
+
+from fastapi import FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import asyncio
+import json
 import sys
 import os
 from pathlib import Path
 
+try:
+    import msgpack
+except ImportError:  # Optional - only needed for ?format=msgpack
+    msgpack = None
+
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from services.fritzWorker import check_for_new_devices
+from services import fritzMetrics as metrics
+from services.fritzLogging import get_logger, setup_logging
+from services.fritzSites import SiteScheduler, load_sites
+from services.fritzWebhook import webhook_from_env
+
+# Structured logs go through a queue to a writer thread (see fritzLogging.py)
+setup_logging()
+log = get_logger('service')
+
+# Seconds a request waits for the very first snapshot after startup
+SNAPSHOT_WAIT_TIMEOUT = float(os.environ.get('FRITZ_SNAPSHOT_WAIT_TIMEOUT', '30'))
+
+# One poll loop and one shared snapshot per site (see fritzSites.py);
+# transitions are pushed to FRITZ_WEBHOOK_URL if configured (see fritzWebhook.py)
+scheduler = SiteScheduler(load_sites(), webhook=webhook_from_env())
+
+metrics.describe('fritz_time_to_ready_seconds', 'Seconds from service start until the first snapshot of a site was available')
+metrics.describe('fritz_snapshot_age_seconds', 'Seconds since the site was last checked')
+metrics.describe('fritz_site_occupied', '1 if new devices were seen at the last check')
+metrics.describe('fritz_next_poll_in_seconds', 'Scheduled delay after the last poll, labelled with the reason')
+metrics.describe('fritz_site_requests', 'Check-devices requests recorded for the site by all workers')
+metrics.describe('fritz_baseline_proposals', 'Devices currently proposed for the baseline of a site')
+
+
+async def _wait_for_snapshot(site_id):
+    """
+    Returns the site's (version, snapshot), waiting up to SNAPSHOT_WAIT_TIMEOUT
+    for the first one.
+    """
+    store = scheduler.stores[site_id]
+    version, snapshot = store.read_versioned()
+    deadline = asyncio.get_running_loop().time() + SNAPSHOT_WAIT_TIMEOUT
+    while snapshot is None and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.25)
+        version, snapshot = store.read_versioned()
+    return version, snapshot
+
+
+async def _report_time_to_ready():
+    """
+    Records when each site first had a successful poll that this worker can serve.
+    The probe and snapshot stores are cleared when a deployment starts (see
+    fritzSnapshotStore.py), so a previous run's state never counts.
+    """
+    pending = set(scheduler.sites)
+    while pending:
+        for site_id in list(pending):
+            probe = scheduler.probes[site_id].read()
+            if probe and probe["last_success_at"] and scheduler.stores[site_id].read() is not None:
+                time_to_ready = round(time.monotonic() - _STARTED_AT, 3)
+                metrics.set_gauge('fritz_time_to_ready_seconds', time_to_ready, {'site': site_id})
+                log.info("Site ready", extra={'site': site_id, 'time_to_ready_s': time_to_ready})
+                pending.discard(site_id)
+        await asyncio.sleep(0.25)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Polling starts in the background, so the server accepts connections right
+    # away while the poller warms up the tunnel, router session and first snapshot
+    scheduler.start()
+    ready_task = asyncio.create_task(_report_time_to_ready())
+    try:
+        yield
+    finally:
+        ready_task.cancel()
+        await scheduler.stop()
 
-app = FastAPI(title="FritzBox Device Checker Service with VPN")
+
+app = FastAPI(title="FritzBox Device Checker Service with VPN", lifespan=lifespan)
 
 # Ensure the services directory is in path
 service_dir = Path(__file__).parent
@@ -57,76 +141,311 @@ def verify_api_key(authorization: str = Header(None)):
     else:
         raise HTTPException(status_code=401, detail="Invalid Authorization format")
 
+def _readiness():
+    """
+    Readiness from cached probe state only. The instance is ready when the site
+    behind /check-devices has a fresh snapshot; other sites are reported for information.
+    """
+    now = datetime.now(timezone.utc)
+    sites = {site_id: scheduler.site_health(site_id, now) for site_id in scheduler.sites}
+    ready = sites[scheduler.default_site_id]["ready"]
+    return ready, {
+        "status": "ready" if ready else "not_ready",
+        "service": "fritz-worker-service",
+        "default_site": scheduler.default_site_id,
+        "sites": sites,
+    }
+
 @app.get("/")
 async def root():
-    """Health check endpoint"""
-    return {"status": "ok", "service": "fritz-worker-service", "vpn_support": True}
+    """Health check endpoint (liveness, see /livez)"""
+    return await livez()
+
+@app.get("/livez")
+async def livez():
+    """Liveness: the event loop answers and every site's poll loop is still running"""
+    alive = scheduler.tasks_alive()
+    return JSONResponse(
+        status_code=200 if alive else 503,
+        content={"status": "ok" if alive else "poll_loop_stopped", "service": "fritz-worker-service"}
+    )
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: tunnel state, router session state, last successful poll and snapshot
+    age per site. Served from cached probe state, so it never triggers router or
+    subprocess work and is safe for frequent orchestrator health checks.
+    """
+    ready, content = _readiness()
+    return JSONResponse(status_code=200 if ready else 503, content=content)
 
 @app.get("/health")
 async def health():
-    """Health check with more details"""
-    return {
-        "status": "healthy",
-        "service": "fritz-worker-service",
-        "vpn_support": True,
-        "wireguard_available": True
+    """Health check with more details (same as /readyz)"""
+    return await readyz()
+
+# Fields of the full check-devices response, selectable via ?fields=
+RESPONSE_FIELDS = (
+    "success", "site_id", "has_new", "new_devices", "message",
+    "device_count", "is_occupied", "checked_at", "trace_id",
+)
+
+MEDIA_TYPES = {"json": "application/json", "msgpack": "application/msgpack"}
+
+# site id -> (snapshot version, {(fields, format): serialized body}). Bodies are
+# built once per snapshot version, so serving the hot status is a copy of cached bytes.
+_response_cache = {}
+MAX_CACHED_SHAPES = 32
+
+
+def _parse_fields(fields):
+    """Validates ?fields= and returns it as a tuple (None = all fields)."""
+    if not fields:
+        return None
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in selected if field not in RESPONSE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def _accept_quality(accept, media_types):
+    """Highest q-value the Accept header gives any of `media_types` (0 if none is listed)."""
+    quality = 0.0
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type.lower() not in media_types:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality = max(quality, q)
+    return quality
+
+
+def _negotiate_format(response_format, accept):
+    """
+    Picks 'json' or 'msgpack' from ?format= or the Accept header (q-values are
+    honoured). Only an explicit ?format=msgpack fails with 406 when msgpack is
+    not installed; Accept-based negotiation falls back to JSON.
+    """
+    if response_format:
+        response_format = response_format.lower()
+        if response_format not in MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {response_format}")
+        if response_format == "msgpack" and msgpack is None:
+            raise HTTPException(status_code=406, detail="MessagePack support is not installed")
+        return response_format
+
+    if not accept:
+        return "json"
+    msgpack_quality = _accept_quality(accept, ("application/msgpack", "application/x-msgpack"))
+    json_quality = _accept_quality(accept, ("application/json", "application/*", "*/*"))
+    if msgpack is not None and msgpack_quality > 0 and msgpack_quality >= json_quality:
+        return "msgpack"
+    return "json"
+
+
+def _build_body(site_id, snapshot, fields, response_format):
+    """Serializes the check-devices response for a snapshot."""
+    has_new = snapshot["has_new"]
+    new_devices = snapshot["new_devices"]
+    
+    # Determine message based on result
+    if has_new:
+        message = "aktuell ist jemand im club"
+    else:
+        message = "aktuell ist niemand im Club"
+    
+    content = {
+        "success": True,
+        "site_id": site_id,
+        "has_new": has_new,
+        "new_devices": new_devices,
+        "message": message,
+        "device_count": len(new_devices),
+        "is_occupied": has_new,  # New devices = club is occupied
+        "checked_at": snapshot["checked_at"],
+        # Matches the trace_id of the log lines written by the check
+        "trace_id": snapshot.get("trace_id")
     }
+    if fields:
+        content = {field: content[field] for field in fields}
+    
+    if response_format == "msgpack":
+        return msgpack.packb(content)
+    # Same encoding as JSONResponse
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+async def _site_response(site_id, fields=None, response_format=None, accept=None):
+    """Serves the check-devices response for a site's current snapshot from the byte cache."""
+    if site_id not in scheduler.sites:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {site_id}")
+    fields = _parse_fields(fields)
+    response_format = _negotiate_format(response_format, accept)
+    
+    # Demand signal for the site's adaptive poll interval
+    scheduler.stores[site_id].record_request()
+    version, snapshot = await _wait_for_snapshot(site_id)
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="No device snapshot available yet")
+    
+    cached_version, bodies = _response_cache.get(site_id, (None, None))
+    if cached_version != version:
+        bodies = {}
+        _response_cache[site_id] = (version, bodies)
+    
+    key = (fields, response_format)
+    body = bodies.get(key)
+    if body is None:
+        try:
+            body = _build_body(site_id, snapshot, fields, response_format)
+        except Exception as e:
+            log.exception("Error building check-devices response", extra={'site': site_id})
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error checking devices: {str(e)}"
+            )
+        # ?fields= is client-controlled, so cap the number of cached shapes
+        if len(bodies) < MAX_CACHED_SHAPES:
+            bodies[key] = body
+    
+    return Response(content=body, media_type=MEDIA_TYPES[response_format])
 
 @app.post("/check-devices")
-async def check_devices(authorization: str = Header(None)):
+async def check_devices(
+    authorization: str = Header(None),
+    accept: str = Header(None),
+    fields: str = Query(None),
+    response_format: str = Query(None, alias="format"),
+):
     """
     Check for new devices on FritzBox network via WireGuard VPN.
-    This endpoint automatically establishes VPN connection, checks devices, and disconnects.
+    Serves the latest snapshot of the first configured site, published by the
+    poller process, so requests never touch the router or the VPN themselves.
     
     Headers:
         Authorization: Bearer YOUR_API_KEY (optional if FRITZ_SERVICE_API_KEY not set)
+        Accept: application/msgpack for a MessagePack body (same as ?format=msgpack)
+    
+    Query:
+        fields: Comma-separated subset of the fields below, e.g. ?fields=is_occupied,device_count
+        format: 'json' (default) or 'msgpack' (requires the msgpack package)
     
     Returns:
         {
+            "site_id": str,
             "has_new": bool,
             "new_devices": list,
             "message": str,
-            "device_count": int
+            "device_count": int,
+            "checked_at": str
         }
     """
     # Verify API key
     verify_api_key(authorization)
-    
-    try:
-        # Check devices using WireGuard VPN (automatically connects/disconnects)
-        has_new, new_devices = check_for_new_devices(vpn_method='wireguard', use_vpn=True)
-        
-        # Determine message based on result
-        if has_new:
-            message = "aktuell ist jemand im club"
-        else:
-            message = "aktuell ist niemand im Club"
-        
-        return JSONResponse(
-            status_code=200,
-            content={
-                "success": True,
-                "has_new": has_new,
-                "new_devices": new_devices,
-                "message": message,
-                "device_count": len(new_devices),
-                "is_occupied": has_new  # New devices = club is occupied
-            }
-        )
-        
-    except Exception as e:
-        print(f"Error checking devices: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error checking devices: {str(e)}"
-        )
+    return await _site_response(scheduler.default_site_id, fields, response_format, accept)
 
 @app.get("/check-devices")
-async def check_devices_get(authorization: str = Header(None)):
+async def check_devices_get(
+    authorization: str = Header(None),
+    accept: str = Header(None),
+    fields: str = Query(None),
+    response_format: str = Query(None, alias="format"),
+):
+    """GET endpoint for convenience (same as POST)"""
+    return await check_devices(authorization, accept, fields, response_format)
+
+@app.get("/sites")
+async def list_sites(authorization: str = Header(None)):
+    """Lists the configured sites and when each was last checked"""
+    verify_api_key(authorization)
+    sites = []
+    for site_id, store in scheduler.stores.items():
+        snapshot = store.read()
+        sites.append({
+            "site_id": site_id,
+            "checked_at": snapshot["checked_at"] if snapshot else None,
+            "is_occupied": snapshot["has_new"] if snapshot else None,
+        })
+    return {"sites": sites}
+
+@app.post("/sites/{site_id}/check-devices")
+async def check_site_devices(
+    site_id: str,
+    authorization: str = Header(None),
+    accept: str = Header(None),
+    fields: str = Query(None),
+    response_format: str = Query(None, alias="format"),
+):
+    """Same as /check-devices for a specific site"""
+    verify_api_key(authorization)
+    return await _site_response(site_id, fields, response_format, accept)
+
+@app.get("/sites/{site_id}/check-devices")
+async def check_site_devices_get(
+    site_id: str,
+    authorization: str = Header(None),
+    accept: str = Header(None),
+    fields: str = Query(None),
+    response_format: str = Query(None, alias="format"),
+):
     """GET endpoint for convenience (same as POST)"""
-    return await check_devices(authorization)
+    return await check_site_devices(site_id, authorization, accept, fields, response_format)
+
+async def _baseline_response(site_id):
+    if site_id not in scheduler.sites:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {site_id}")
+    baseline = scheduler.baseline_proposals(site_id)
+    if baseline is None:
+        raise HTTPException(status_code=503, detail="No baseline statistics available yet")
+    return baseline
+
+@app.get("/baseline/proposals")
+async def baseline_proposals(authorization: str = Header(None)):
+    """Devices that are (nearly) always connected and could join the baseline of the default site"""
+    verify_api_key(authorization)
+    return await _baseline_response(scheduler.default_site_id)
+
+@app.get("/sites/{site_id}/baseline/proposals")
+async def site_baseline_proposals(site_id: str, authorization: str = Header(None)):
+    """Same as /baseline/proposals for a specific site"""
+    verify_api_key(authorization)
+    return await _baseline_response(site_id)
+
+@app.get("/metrics")
+async def metrics_endpoint(authorization: str = Header(None)):
+    """
+    Prometheus metrics of this worker plus the shared per-site scheduling state.
+    Includes the occupancy of every site, so it needs the API key like /check-devices
+    (Prometheus: authorization.credentials in the scrape config).
+    """
+    verify_api_key(authorization)
+    now = datetime.now(timezone.utc)
+    site_gauges = []
+    for site_id, store in scheduler.stores.items():
+        snapshot = store.read()
+        if snapshot is None:
+            continue
+        labels = {'site': site_id}
+        age = (now - datetime.fromisoformat(snapshot["checked_at"])).total_seconds()
+        site_gauges.append(('fritz_snapshot_age_seconds', round(age, 3), labels))
+        site_gauges.append(('fritz_site_occupied', int(snapshot["has_new"]), labels))
+        if "next_poll_in" in snapshot:
+            site_gauges.append(('fritz_next_poll_in_seconds', snapshot["next_poll_in"],
+                                {'site': site_id, 'reason': snapshot["poll_reason"]}))
+        site_gauges.append(('fritz_site_requests', store.request_count(), labels))
+        baseline = scheduler.baseline_proposals(site_id)
+        if baseline is not None:
+            site_gauges.append(('fritz_baseline_proposals', len(baseline["proposals"]), labels))
+    return PlainTextResponse(metrics.render(site_gauges))
 
 if __name__ == "__main__":
     import uvicorn